@@ -1,6 +1,33 @@
+import csv
+import json
+
 from pytest_bdd import given, when, then, parsers
 from src.utils.db_manager import DB
 
+# Number of rows pulled from the cursor per fetchmany() call
+FETCH_BATCH_SIZE = 1000
+
+
+def _parse_params(params):
+    """Parse a comma-separated params string; quoted values may contain commas."""
+    if not params or params.strip().lower() == 'none':
+        return []
+    return [p.strip() for p in next(csv.reader([params], skipinitialspace=True))]
+
+
+def _get_query_result(request):
+    """Return the last query result, preferring the in-process copy on the test node.
+
+    The result is stored column-wise as {"columns": [...], "data": {column: [values]},
+    "count": n}; raw row tuples are not kept. None is returned when no query has been
+    executed, including when the "query_result" cache key still holds the old
+    list-of-row-dicts format from an earlier run.
+    """
+    result = getattr(request.node, '_query_result', None)
+    if result is None:
+        result = request.config.cache.get("query_result", None)
+    return result if isinstance(result, dict) else None
+
 
 @when(parsers.cfparse('I connect to database "{db_path}"'))
 def connect_db(request, db_path, config):
@@ -28,13 +55,14 @@ def execute_sql_query(sql_query, request):
     """Execute SQL query without parameters."""
     execute_query(request, sql_query, "")
     
-    # Also store results in request.cls for backward compatibility
-    if hasattr(request, 'cls'):
-        result = request.config.cache.get("query_result", [])
-        request.cls.query_results = result
-        # Extract column names from first row if available
-        if result:
-            request.cls.result_columns = list(result[0].keys()) if isinstance(result[0], dict) else []
+    # Also store results in request.cls for backward compatibility; row dicts
+    # are rebuilt only on this legacy path
+    cls = getattr(request, 'cls', None)
+    if cls is not None:
+        result = _get_query_result(request)
+        data = result["data"]
+        cls.query_results = [dict(zip(data, row)) for row in zip(*data.values())]
+        cls.result_columns = result["columns"]
 
 
 @when(parsers.cfparse('I execute query "{sql}" with params "{params}"'))
@@ -43,25 +71,36 @@ def execute_query(request, sql, params):
     db = request.config.cache.get("db_instance", None)
     assert db, "Database connection not initialized"
     
-    # Parse parameters
-    params_list = []
-    if params and params.strip().lower() != 'none':
-        params_list = [p.strip() for p in params.split(",")]
-    
     try:
+        params_list = _parse_params(params)
+        
         # Execute query and get cursor
         cursor = db._execute(sql, params_list)
         
         # Get column names from cursor description
         columns = [desc[0] for desc in cursor.description] if cursor.description else []
         
-        # Convert results to list of dictionaries
-        result = []
-        for row in cursor.fetchall():
-            result.append(dict(zip(columns, row)))
+        # Fetch rows in batches and transpose each batch straight into one list
+        # per column, so only a single batch of raw tuples is held at a time
+        values = [[] for _ in columns]
+        count = 0
+        batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+        while batch:
+            for column_values, batch_values in zip(values, zip(*batch)):
+                column_values.extend(batch_values)
+            count += len(batch)
+            batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+        result = {"columns": columns, "data": dict(zip(columns, values)), "count": count}
+        
+        # Keep a direct reference on the test node so later steps skip the
+        # cache's JSON round-trip and native values (Decimal, datetime) survive
+        request.node._query_result = result
         
-        # Store results in cache
-        request.config.cache.set("query_result", result)
+        # Store results in cache; values JSON can't encode are stored as strings
+        try:
+            request.config.cache.set("query_result", result)
+        except TypeError:
+            request.config.cache.set("query_result", json.loads(json.dumps(result, default=str)))
     except Exception as e:
         raise RuntimeError(f"Failed to execute query: {str(e)}")
 
@@ -72,12 +111,9 @@ def execute_update(request, sql, params):
     db = request.config.cache.get("db_instance", None)
     assert db, "Database connection not initialized"
     
-    # Parse parameters
-    params_list = []
-    if params and params.strip().lower() != 'none':
-        params_list = [p.strip() for p in params.split(",")]
-    
     try:
+        params_list = _parse_params(params)
+        
         # Execute update and get affected rows count
         cursor = db._execute(sql, params_list)
         affected_rows = cursor.rowcount
@@ -91,24 +127,25 @@ def execute_update(request, sql, params):
 @then('I should get results with "<count>" rows')
 def verify_result_count(count, request):
     """Verify that the query returned the expected number of rows."""
-    # Try to get from cache first, then fall back to request.cls for backward compatibility
-    result = request.config.cache.get("query_result", [])
-    if not result and hasattr(request, 'cls') and hasattr(request.cls, 'query_results'):
-        result = request.cls.query_results
+    # Try the in-process result first (pytest cache as fallback), then request.cls for backward compatibility
+    result = _get_query_result(request)
+    if result:
+        actual_count = result["count"]
+    else:
+        actual_count = len(getattr(request.cls, 'query_results', None) or [])
     
-    assert len(result) == int(count), f"Expected {count} rows, got {len(result)}"
+    assert actual_count == int(count), f"Expected {count} rows, got {actual_count}"
 
 
 @then('the results should contain column "<column_name>"')
 def verify_result_column(column_name, request):
     """Verify that the query results contain the specified column."""
-    # Try to get columns from cache first, then fall back to request.cls
-    columns = []
-    result = request.config.cache.get("query_result", [])
+    # Try the in-process result first (pytest cache as fallback), then request.cls
+    result = _get_query_result(request)
     if result:
-        columns = list(result[0].keys()) if isinstance(result[0], dict) else []
-    elif hasattr(request, 'cls') and hasattr(request.cls, 'result_columns'):
-        columns = request.cls.result_columns
+        columns = result["columns"]
+    else:
+        columns = getattr(request.cls, 'result_columns', None) or []
     
     assert column_name in columns, f"Column '{column_name}' not found in result set"
 
@@ -116,14 +153,14 @@ def verify_result_column(column_name, request):
 @then(parsers.cfparse('the result field "{field}" should be "{expected_value}"'))
 def verify_field_value(request, field, expected_value):
     """Verify that a specific field in the query result equals the expected value."""
-    result = request.config.cache.get("query_result", [])
-    assert result, "No query results found"
+    result = _get_query_result(request)
+    assert result and result["count"], "No query results found"
     
-    # Get the first row of results
-    first_row = result[0]
-    assert field in first_row, f"Field '{field}' not found in query results"
+    # Get the value of the field in the first row
+    data = result["data"]
+    assert field in data, f"Field '{field}' not found in query results"
     
     # Get actual value and convert to string for comparison
-    actual_value = str(first_row[field])
+    actual_value = str(data[field][0])
     assert actual_value == expected_value, \
         f"Expected field '{field}' to be '{expected_value}', but got '{actual_value}'"
\ No newline at end of file